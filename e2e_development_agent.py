@@ -1,15 +1,28 @@
-import tempfile
+import asyncio
 import streamlit as st
-from PyPDF2 import PdfReader
+from pypdf import PdfReader
 from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from pdf_workers import extract_page_range
 import re
-from langchain_core.messages import HumanMessage, AIMessage
+import string
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from langchain_core.runnables import RunnableConfig
 from langchain_openai import ChatOpenAI
 from langgraph.graph import StateGraph, END, START
+from langgraph.types import Send
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 import json
+import hashlib
+import operator
+import shelve
+import threading
+import queue
+import time
 from dotenv import load_dotenv
 import os
-from typing import TypedDict, List, Dict, Any, Optional
+from typing import TypedDict, List, Dict, Any, Optional, Annotated
 
 # Load environment variables
 load_dotenv()
@@ -17,55 +30,241 @@ os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
 # Configuration
 st.set_page_config(page_title="Multi-Agent App Development System", layout="wide")
 
-# Initialize OpenAI Mini model
-def init_llm():
+# On-disk location of the exact-match prompt cache
+PROMPT_CACHE_PATH = ".prompt_cache"
+# On-disk location of extracted PDF text, keyed by content hash
+PDF_TEXT_CACHE_PATH = ".pdf_text_cache"
+# SQLite database holding LangGraph checkpoints, so runs survive a lost session
+CHECKPOINT_DB_PATH = ".lg_state.db"
+# Maximum number of batched LLM requests in flight at once, to stay under rate limits
+MAX_CONCURRENT_REQUESTS = 5
+# On-disk cache entries expire after a week
+CACHE_TTL_SECONDS = 7 * 86400
+# Oldest cached LLM responses are evicted past this many
+PROMPT_CACHE_MAX_ENTRIES = 2000
+# Oldest cached PDF texts are evicted past this many
+PDF_TEXT_CACHE_MAX_ENTRIES = 200
+
+# Shelve-backed cache whose entries expire after ttl seconds, evicting the oldest past max_entries
+class DiskCache:
+    def __init__(self, path, ttl, max_entries):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # Streamlit sessions share this object across threads, and shelve is not thread-safe
+        self.lock = threading.Lock()
+        
+        # Drop expired entries, and the earlier layout that stored bare values, then index the rest
+        # by store time (oldest first) for eviction
+        now = time.time()
+        stored = []
+        with self.lock, shelve.open(self.path) as cache:
+            for key in list(cache.keys()):
+                entry = cache[key]
+                if not isinstance(entry, dict) or now - entry["stored_at"] > ttl:
+                    del cache[key]
+                else:
+                    stored.append((entry["stored_at"], key))
+        self.stored_at = {key: stored_at for stored_at, key in sorted(stored)}
+    
+    def get(self, key):
+        with self.lock, shelve.open(self.path) as cache:
+            entry = cache.get(key)
+            # Expired entries are deleted as they're found, so the store doesn't keep them forever
+            if entry is not None and time.time() - entry["stored_at"] > self.ttl:
+                del cache[key]
+                self.stored_at.pop(key, None)
+                entry = None
+        return None if entry is None else entry["value"]
+    
+    def set(self, key, value):
+        now = time.time()
+        with self.lock, shelve.open(self.path) as cache:
+            cache[key] = {"stored_at": now, "value": value}
+            # Re-insert so a rewritten key moves to the newest end of the index
+            self.stored_at.pop(key, None)
+            self.stored_at[key] = now
+            
+            # Evict the oldest entries once the store is over its cap
+            while len(self.stored_at) > self.max_entries:
+                old_key = next(iter(self.stored_at))
+                del self.stored_at[old_key]
+                cache.pop(old_key, None)
+
+# Exact-match prompt cache in front of the LLM, so identical prompts skip the API round-trip
+class CachedLLM:
+    def __init__(self, llm, path=PROMPT_CACHE_PATH):
+        self.llm = llm
+        self.cache = DiskCache(path, CACHE_TTL_SECONDS, PROMPT_CACHE_MAX_ENTRIES)
+    
+    def cache_key(self, messages):
+        transcript = "\n".join(f"{msg.type}: {msg.content}" for msg in messages)
+        return hashlib.sha256(f"{self.llm.model_name}\n{transcript}".encode("utf-8")).hexdigest()
+    
+    # The node's config is passed through so LangGraph can stream the call's tokens; before
+    # Python 3.11 it can't reach the inner LLM call through contextvars on its own
+    async def ainvoke(self, messages, config=None):
+        key = self.cache_key(messages)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return AIMessage(content=cached)
+        
+        response = await self.llm.ainvoke(messages, config)
+        self.cache.set(key, response.content)
+        return response
+    
+    async def abatch(self, batch, config=None, max_concurrency=MAX_CONCURRENT_REQUESTS):
+        # Independent prompts go out concurrently, a bounded number at a time, each still checked against the cache
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def invoke(messages):
+            async with semaphore:
+                return await self.ainvoke(messages, config)
+        
+        return await asyncio.gather(*(invoke(messages) for messages in batch))
+
+# One event loop for the whole process, running on a daemon thread. The shared LLM's pooled
+# connections belong to the loop that opened them, so every session's graph runs on this loop
+@st.cache_resource
+def get_event_loop():
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="llm-event-loop", daemon=True).start()
+    return loop
+
+# Initialize OpenAI Mini model (cached once per process, shared across sessions)
+@st.cache_resource
+def get_llm():
     # Using OpenAI Mini - you'll need to replace with your own API key and endpoint
     # For demo purposes, we're using a standard OpenAI model, but you'd replace this with Mini
-    return ChatOpenAI(
+    return CachedLLM(ChatOpenAI(
         model="gpt-4o-mini",  # Replace with OpenAI Mini model name
         temperature=0.2,
-    )
+    ))
+
+# Regexes used to parse agent responses, compiled once at import
+CODE_BLOCK_RE = re.compile(r"```(\w+)?\n(.*?)```", re.DOTALL)
+PROJECT_NAME_RE = re.compile(r"# (.+?)(\n|$)")
+FEATURES_SECTION_RE = re.compile(r"(?:Features|Main features|Key features):(.*?)(?:\n#|\n\n\d\.|\Z)", re.DOTALL | re.IGNORECASE)
+FEATURE_ITEM_RE = re.compile(r"[-\*•]?\s*(.*?)(?:\n[-\*•]|\n\n|\Z)", re.DOTALL)
+# Split requirements before numbered ("2.1 Scope") or all-caps heading lines
+SECTION_HEADING_RE = re.compile(r"\n(?=\d+(?:\.\d+)*\.?\s+[A-Z]|[A-Z][A-Z /&-]{3,}\n)")
+
+# Requirements longer than this are summarized section by section before planning
+LONG_REQUIREMENTS_CHARS = 12000
+# Upper bound on the size of one section chunk sent for summarization
+SECTION_CHUNK_CHARS = 6000
+SECTION_SUMMARY_PROMPT = """You are the Project Manager. Summarize the requirements section you are given.
+Keep every feature, constraint and acceptance criterion; drop boilerplate and repetition."""
 
 # Define agent roles
 ROLES = {
     "project_manager": "Analyzes requirements and coordinates tasks.",
     "designer": "Creates UI/UX designs and wireframes.",
-    "developer": "Writes code and implements features.",
+    "developer_arch": "Outlines the architecture and dependencies.",
+    "developer_impl": "Writes code and implements features.",
     "tester": "Tests functionality and identifies bugs.",
     "presenter": "Prepares presentations of the final product."
 }
 
+# Merge dict updates so parallel agents writing the same key don't clobber each other
+def merge_dicts(left, right):
+    return {**left, **right}
+
 # Define the typed system state
 class AppState(TypedDict):
     requirements: str
-    messages: List[Any]
+    messages: Annotated[List[Any], operator.add]
     current_stage: str
-    design_docs: Dict[str, Any]
-    code_modules: Dict[str, Any]
-    test_results: Dict[str, Any]
-    presentation: Dict[str, Any]
+    design_docs: Annotated[Dict[str, Any], merge_dicts]
+    code_modules: Annotated[Dict[str, Any], merge_dicts]
+    test_results: Annotated[Dict[str, Any], merge_dicts]
+    presentation: Annotated[Dict[str, Any], merge_dicts]
     current_agent: str
 
+# PDFs with at least this many pages are extracted across worker processes
+PARALLEL_PDF_MIN_PAGES = 20
+
 # Extract text from PDF
 def extract_text_from_pdf(pdf_file):
-    pdf_reader = PdfReader(BytesIO(pdf_file.read()))
-    text = ""
-    for page in pdf_reader.pages:
-        text += page.extract_text()
+    raw = pdf_file.read()
+    page_count = len(PdfReader(BytesIO(raw)).pages)
+    # Spawn and forkserver workers start a fresh interpreter and re-import the app's entry point, which
+    # costs more than parallel extraction saves, so platforms without fork stay serial
+    if page_count < PARALLEL_PDF_MIN_PAGES or "fork" not in multiprocessing.get_all_start_methods():
+        return extract_page_range(raw, 0, page_count)
+    
+    # pypdf is pure Python, so split the pages into one contiguous range per worker process
+    workers = min(os.cpu_count() or 1, page_count)
+    bounds = [page_count * i // workers for i in range(workers + 1)]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork")) as executor:
+        chunks = executor.map(extract_page_range, [raw] * workers, bounds[:-1], bounds[1:])
+        return "".join(chunks)
+
+# One PDF text cache per process; a module-level object would be recreated on every rerun
+@st.cache_resource
+def get_pdf_text_cache():
+    return DiskCache(PDF_TEXT_CACHE_PATH, CACHE_TTL_SECONDS, PDF_TEXT_CACHE_MAX_ENTRIES)
+
+# Extract text once per distinct PDF, shared across sessions and restarts
+def get_pdf_text(pdf_bytes, pdf_key):
+    cache = get_pdf_text_cache()
+    text = cache.get(pdf_key)
+    if text is None:
+        text = extract_text_from_pdf(BytesIO(pdf_bytes))
+        cache.set(pdf_key, text)
     return text
 
-# Define agent nodes
-def create_agent_node(role, llm):
-    def agent_fn(state: AppState):
-        # Create a prompt based on the role and current state
-        prompt_templates = {
-            "project_manager": """You are the Project Manager. Analyze the following requirements and provide a structured project plan:
-            
-Requirements:
-{requirements}
+# Serialize artifacts for prompts without pretty-printing whitespace, which is billed as tokens
+def compact_json(value):
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+# Split text into pieces of at most limit characters, preferring paragraph, then line, then word boundaries
+def split_text(text, limit):
+    if len(text) <= limit:
+        return [text]
+    for separator in ("\n\n", "\n", " "):
+        parts = text.split(separator)
+        if len(parts) > 1:
+            break
+    else:
+        return [text[i:i + limit] for i in range(0, len(text), limit)]
+    
+    # Repack the parts up to the limit, splitting any part that is still too long on a finer boundary
+    pieces = [""]
+    for part in parts:
+        for piece in split_text(part, limit):
+            if pieces[-1] and len(pieces[-1]) + len(separator) + len(piece) > limit:
+                pieces.append("")
+            pieces[-1] += (separator if pieces[-1] else "") + piece
+    return pieces
+
+# Summarize long requirements as a batch of per-section calls that run concurrently
+async def summarize_requirements(llm, requirements, config):
+    # Pack consecutive sections into chunks so short sections don't each cost a call; sections over
+    # the cap, or text whose headings the regex doesn't recognise, are split so the cap always holds
+    chunks = [""]
+    for section in SECTION_HEADING_RE.split(requirements):
+        for piece in split_text(section, SECTION_CHUNK_CHARS - 1):
+            if chunks[-1] and len(chunks[-1]) + len(piece) + 1 > SECTION_CHUNK_CHARS:
+                chunks.append("")
+            chunks[-1] += piece + "\n"
+    
+    # A single chunk would only add a serial round-trip before planning, so plan from the original text
+    if len(chunks) == 1:
+        return requirements
+    
+    # The summaries run concurrently inside the project manager's node; tag them so LangGraph doesn't
+    # stream their interleaved tokens into the project manager's live output
+    summaries = await llm.abatch([
+        [SystemMessage(content=SECTION_SUMMARY_PROMPT), HumanMessage(content=chunk)]
+        for chunk in chunks
+    ], {**config, "tags": [*config.get("tags", []), "nostream"]})
+    return "\n\n".join(summary.content for summary in summaries)
 
-Current conversation:
-{conversation}
+# The requirements lead every prompt in a message of their own, so all agents in a run share that
+# prefix for OpenAI's prompt caching; role instructions follow, then the stage artifacts last
+SYSTEM_PROMPTS = {
+    "project_manager": """You are the Project Manager. Analyze the requirements you are given and provide a structured project plan.
 
 Your response should include:
 1. Project scope
@@ -75,16 +274,7 @@ Your response should include:
 5. Task assignments for the team
 6. Next steps
 """,
-            "designer": """You are the UI/UX Designer. Create design specifications based on the following requirements and project plan:
-            
-Requirements:
-{requirements}
-
-Project Plan:
-{project_plan}
-
-Current conversation:
-{conversation}
+    "designer": """You are the UI/UX Designer. Create design specifications based on the requirements and project plan you are given.
 
 Your response should include:
 1. Wireframes description (describe key screens)
@@ -93,35 +283,21 @@ Your response should include:
 4. Design system suggestions (colors, typography, etc.)
 5. Responsive design considerations
 """,
-            "developer": """You are the Developer. Write code based on the requirements and design specifications:
-            
-Requirements:
-{requirements}
-
-Design Specifications:
-{design_specs}
-
-Current conversation:
-{conversation}
+    "developer_arch": """You are the Developer. Outline the architecture based on the requirements and project plan you are given.
 
 Your response should include:
 1. Architecture overview
-2. Implementation approach
-3. Code structure
-4. Sample code for key components
-5. Dependencies and libraries needed
-6. Setup instructions
+2. Code structure
+3. Dependencies and libraries needed
+4. Setup instructions
 """,
-            "tester": """You are the Tester. Create a test plan and test cases based on the requirements and implemented code:
-            
-Requirements:
-{requirements}
+    "developer_impl": """You are the Developer. Write code based on the requirements, design specifications and architecture you are given.
 
-Implementation:
-{implementation}
-
-Current conversation:
-{conversation}
+Your response should include:
+1. Implementation approach
+2. Sample code for key components
+""",
+    "tester": """You are the Tester. Create a test plan and test cases based on the requirements and implemented code you are given.
 
 Your response should include:
 1. Test plan overview
@@ -131,12 +307,46 @@ Your response should include:
 5. Edge cases to consider
 6. Potential bugs to look for
 """,
-            "presenter": """You are the Presenter. Create a presentation of the final product based on all the work done:
-            
-Requirements:
-{requirements}
+    "presenter": """You are the Presenter. Create a presentation of the final product based on all the work you are given.
 
-Design:
+Your response should include:
+1. Introduction to the product
+2. Key features and functionality
+3. Technical highlights
+4. Implementation challenges and solutions
+5. Demo script
+6. Future enhancements
+"""
+}
+
+# Per-role context templates, filled from the current state on each call
+CONTEXT_TEMPLATES = {
+    "project_manager": """Your turn.
+""",
+    "designer": """Project Plan:
+{project_plan}
+
+Your turn.
+""",
+    "developer_arch": """Project Plan:
+{project_plan}
+
+Your turn.
+""",
+    "developer_impl": """Design Specifications:
+{design_specs}
+
+Architecture:
+{architecture}
+
+Your turn.
+""",
+    "tester": """Implementation:
+{implementation}
+
+Your turn.
+""",
+    "presenter": """Design:
 {design}
 
 Implementation:
@@ -145,99 +355,87 @@ Implementation:
 Test Results:
 {test_results}
 
-Current conversation:
-{conversation}
-
-Your response should include:
-1. Introduction to the product
-2. Key features and functionality
-3. Technical highlights
-4. Implementation challenges and solutions
-5. Demo script
-6. Future enhancements
+Your turn.
 """
-        }
-        
-        # Format conversation history
-        conversation_str = ""
-        for msg in state["messages"]:
-            if isinstance(msg, HumanMessage):
-                conversation_str += f"Human: {msg.content}\n"
-            else:
-                conversation_str += f"AI ({msg.name if hasattr(msg, 'name') else 'Assistant'}): {msg.content}\n"
+}
+
+# Define agent nodes
+def create_agent_node(role, llm):
+    # Resolve this role's prompts once, so each call only fills in the dynamic fields
+    system_message = SystemMessage(content=SYSTEM_PROMPTS[role])
+    template = CONTEXT_TEMPLATES[role]
+    fields = [name for _, name, _, _ in string.Formatter().parse(template) if name]
+    
+    async def agent_fn(state: AppState, config: RunnableConfig):
+        # The project manager plans from section summaries when the requirements are long
+        requirements = state["requirements"]
+        if role == "project_manager" and len(requirements) > LONG_REQUIREMENTS_CHARS:
+            requirements = await summarize_requirements(llm, requirements, config)
         
-        # Get the right template and format it
-        template = prompt_templates[role]
-        prompt = template.format(
-            requirements=state["requirements"],
-            conversation=conversation_str,
-            project_plan=state["messages"][0].content if len(state["messages"]) > 0 and state["current_stage"] != "requirements" else "",
-            design_specs=state["design_docs"].get("specifications", "") if state["current_stage"] not in ["requirements"] else "",
-            implementation=json.dumps(state["code_modules"], indent=2) if state["current_stage"] not in ["requirements", "design"] else "",
-            design=json.dumps(state["design_docs"], indent=2) if state["current_stage"] not in ["requirements"] else "",
-            test_results=json.dumps(state["test_results"], indent=2) if state["current_stage"] not in ["requirements", "design", "development"] else ""
-        )
+        # Build fields lazily so only the ones this template references get serialized
+        field_builders = {
+            "project_plan": lambda: state["messages"][0].content if len(state["messages"]) > 0 and state["current_stage"] != "requirements" else "",
+            "design_specs": lambda: state["design_docs"].get("specifications", "") if state["current_stage"] not in ["requirements"] else "",
+            "architecture": lambda: state["design_docs"].get("architecture", "") if state["current_stage"] not in ["requirements"] else "",
+            "implementation": lambda: compact_json(state["code_modules"]) if state["current_stage"] not in ["requirements", "design"] else "",
+            "design": lambda: compact_json(state["design_docs"]) if state["current_stage"] not in ["requirements"] else "",
+            "test_results": lambda: compact_json(state["test_results"]) if state["current_stage"] not in ["requirements", "design", "development"] else ""
+        }
+        context = template.format(**{name: field_builders[name]() for name in fields})
         
-        # Call the LLM
-        response = llm.invoke(prompt)
+        # No transcript is replayed: every template already embeds the earlier stages' artifacts,
+        # so prior agent messages would only send the same content twice
+        requirements_message = SystemMessage(content="Requirements document:\n" + requirements)
+        prompt = [requirements_message, system_message, HumanMessage(content=context)]
         
-        # Update state with the agent's response
-        new_messages = state["messages"] + [AIMessage(content=response.content, name=role)]
+        # Call the LLM without blocking, so parallel agents overlap their API latency
+        response = await llm.ainvoke(prompt, config)
         
-        # Create new dictionaries to ensure we're properly updating mutable values
-        new_design_docs = state["design_docs"].copy() 
-        new_code_modules = state["code_modules"].copy()
-        new_test_results = state["test_results"].copy()
-        new_presentation = state["presentation"].copy()
+        # Update state with the agent's response (the messages reducer appends it). Keeping the
+        # response's id lets LangGraph's messages stream skip it after streaming its chunks
+        new_messages = [AIMessage(content=response.content, name=role, id=response.id)]
         
-        # Update specific artifacts based on the current stage
-        new_current_stage = state["current_stage"]
-        new_current_agent = state["current_agent"]
+        # Artifact dicts merge through their reducers, so each branch returns only its delta
+        updates = {"messages": new_messages}
         
         if role == "project_manager" and state["current_stage"] == "requirements":
-            new_current_stage = "design"
-            new_current_agent = "designer"
+            updates["current_stage"] = "design"
+            updates["current_agent"] = "designer"
         elif role == "designer" and state["current_stage"] == "design":
-            new_design_docs["specifications"] = response.content
-            new_current_stage = "development"
-            new_current_agent = "developer"
-        elif role == "developer" and state["current_stage"] == "development":
+            updates["design_docs"] = {"specifications": response.content}
+            updates["current_stage"] = "development"
+            updates["current_agent"] = "developer_impl"
+        elif role == "developer_arch" and state["current_stage"] == "design":
+            # Runs in parallel with the designer, so it leaves stage bookkeeping to the designer
+            updates["design_docs"] = {"architecture": response.content}
+        elif role == "developer_impl" and state["current_stage"] == "development":
             # Extract code blocks from the response
-            code_blocks = re.findall(r"```(\w+)?\n(.*?)```", response.content, re.DOTALL)
-            for i, (lang, code) in enumerate(code_blocks):
-                new_code_modules[f"module_{i+1}"] = {
+            code_blocks = CODE_BLOCK_RE.findall(response.content)
+            updates["code_modules"] = {
+                f"module_{i+1}": {
                     "language": lang.strip() if lang else "text",
                     "code": code.strip()
                 }
-            new_current_stage = "testing"
-            new_current_agent = "tester"
+                for i, (lang, code) in enumerate(code_blocks)
+            }
+            updates["current_stage"] = "testing"
+            updates["current_agent"] = "tester"
         elif role == "tester" and state["current_stage"] == "testing":
-            new_test_results["test_plan"] = response.content
-            new_current_stage = "presentation"
-            new_current_agent = "presenter"
+            updates["test_results"] = {"test_plan": response.content}
+            updates["current_stage"] = "presentation"
+            updates["current_agent"] = "presenter"
         elif role == "presenter" and state["current_stage"] == "presentation":
-            new_presentation["content"] = response.content
-            new_current_stage = "complete"
+            updates["presentation"] = {"content": response.content}
+            updates["current_stage"] = "complete"
         
         # Return only the updated values
-        return {
-            "messages": new_messages,
-            "current_stage": new_current_stage,
-            "current_agent": new_current_agent,
-            "design_docs": new_design_docs,
-            "code_modules": new_code_modules,
-            "test_results": new_test_results, 
-            "presentation": new_presentation
-        }
+        return updates
     
     return agent_fn
 
-# Define the router function
-def router(state):
-    current_stage = state["current_stage"]
-    if current_stage == "complete":
-        return END
-    return state["current_agent"]
+# Fan out the designer and the developer's architecture pass once the plan is ready
+def fan_out(state):
+    return [Send("designer", state), Send("developer_arch", state)]
 
 # Build the LangGraph
 def build_graph(llm):
@@ -259,36 +457,90 @@ def build_graph(llm):
     # Add edges from START to the first agent (project_manager)
     workflow.add_edge(START, "project_manager")
     
-    # Add conditional edges based on the workflow stages
-    for role in ROLES.keys():
-        workflow.add_conditional_edges(
-            role,
-            router,
-            {
-                "project_manager": "project_manager",
-                "designer": "designer",
-                "developer": "developer",
-                "tester": "tester",
-                "presenter": "presenter",
-                END: END
-            }
-        )
+    # Run the designer and the architecture pass in parallel after the project manager
+    workflow.add_conditional_edges("project_manager", fan_out, ["designer", "developer_arch"])
+    
+    # Implementation waits for both the design specs and the architecture
+    workflow.add_edge(["designer", "developer_arch"], "developer_impl")
+    
+    # The rest of the workflow is strictly linear
+    workflow.add_edge("developer_impl", "tester")
+    workflow.add_edge("tester", "presenter")
+    workflow.add_edge("presenter", END)
     
     return workflow.compile()
 
+# Compile the graph once per process; the leading underscore keeps Streamlit from hashing the llm
+@st.cache_resource
+def get_graph(_llm):
+    return build_graph(_llm)
+
+# Run the graph with SQLite checkpoints, passing each agent's tokens to emit as they arrive
+async def stream_graph(graph, state, emit, thread_id):
+    config = {"configurable": {"thread_id": thread_id}}
+    async with AsyncSqliteSaver.from_conn_string(CHECKPOINT_DB_PATH) as checkpointer:
+        graph = graph.copy({"checkpointer": checkpointer})
+        
+        # A finished thread is returned as is; an interrupted one resumes after its last checkpoint
+        snapshot = await graph.aget_state(config)
+        if snapshot.values and not snapshot.next:
+            return snapshot.values
+        graph_input = None if snapshot.values else state
+        
+        final_state = snapshot.values or state
+        async for mode, chunk in graph.astream(graph_input, config, stream_mode=["messages", "values"]):
+            if mode == "messages":
+                message_chunk, metadata = chunk
+                emit((metadata["langgraph_node"], message_chunk.content))
+            else:
+                final_state = chunk
+        return final_state
+
+# Run the graph on the shared event loop, painting each agent's tokens into a placeholder as they arrive.
+# Streamlit calls only work on the script thread, so tokens come back through a queue and are drawn here
+def run_graph(graph, state, placeholder, thread_id):
+    events = queue.SimpleQueue()
+    run = asyncio.run_coroutine_threadsafe(stream_graph(graph, state, events.put, thread_id), get_event_loop())
+    # Wake up when the run ends too, so a failure doesn't leave us waiting on the queue
+    run.add_done_callback(lambda _: events.put(None))
+    
+    try:
+        outputs = {}
+        while (event := events.get()) is not None:
+            node, text = event
+            outputs[node] = outputs.get(node, "") + text
+            placeholder.markdown("\n\n".join(f"**{node}**: {text}" for node, text in outputs.items()))
+        return run.result()
+    finally:
+        # Stop the run if the script is interrupted while waiting on it
+        run.cancel()
+
+# Render the agent conversation as a single markdown block
+def render_messages(messages):
+    lines = []
+    for msg in messages:
+        if isinstance(msg, HumanMessage):
+            lines.append(f"**You**: {msg.content}")
+        else:
+            lines.append(f"**{msg.name}**: {msg.content}")
+    return "\n\n".join(lines)
+
 # Streamlit UI
 def main():
     st.title("Multi-Agent App Development System")
     
     # Initialize session state
     if "initialized" not in st.session_state:
-        st.session_state.graph = None
         st.session_state.state = None
         st.session_state.requirements = ""
-        st.session_state.llm = init_llm()
+        st.session_state.llm = get_llm()
+        st.session_state.graph = get_graph(st.session_state.llm)
         st.session_state.initialized = True
         st.session_state.process_started = False
     
+    # Live output for agents while they are generating
+    live_output = st.empty()
+    
     # Sidebar for uploading requirements
     with st.sidebar:
         st.header("Upload Requirements")
@@ -297,7 +549,13 @@ def main():
         if uploaded_file and not st.session_state.process_started:
             if st.button("Process Requirements"):
                 with st.spinner("Extracting text from PDF..."):
-                    requirements_text = extract_text_from_pdf(uploaded_file)
+                    # Reuse the extracted text when the same PDF is processed again
+                    pdf_bytes = uploaded_file.getvalue()
+                    pdf_key = hashlib.blake2b(pdf_bytes, digest_size=16).hexdigest()
+                    requirements_text = get_pdf_text(pdf_bytes, pdf_key)
+                    
+                    # Checkpoints are keyed by the PDF contents, so re-uploading it resumes the same run
+                    st.session_state.thread_id = pdf_key
                     st.session_state.requirements = requirements_text
                     
                     # Initialize the state
@@ -313,11 +571,11 @@ def main():
                     }
                     st.session_state.state = initial_state
                     
-                    # Build the graph
-                    st.session_state.graph = build_graph(st.session_state.llm)
-                    
                     # Start the process
-                    st.session_state.state = st.session_state.graph.invoke(st.session_state.state)
+                    st.session_state.state = run_graph(
+                        st.session_state.graph, st.session_state.state, live_output, st.session_state.thread_id
+                    )
+                    live_output.empty()
                     
                     # Mark process as started
                     st.session_state.process_started = True
@@ -344,12 +602,9 @@ def main():
         with tabs[0]:  # Conversation
             st.subheader("Agent Conversation")
             
-            # Display conversation
-            for msg in st.session_state.state["messages"]:
-                if isinstance(msg, HumanMessage):
-                    st.markdown(f"**You**: {msg.content}")
-                else:
-                    st.markdown(f"**{msg.name}**: {msg.content}")
+            # Display conversation in a placeholder that later steps update in place
+            convo_placeholder = st.empty()
+            convo_placeholder.markdown(render_messages(st.session_state.state["messages"]))
             
             # Button to advance the workflow
             if st.session_state.state["current_stage"] != "complete":
@@ -357,8 +612,10 @@ def main():
                 if st.button(f"Let {current_agent.replace('_', ' ').title()} work"):
                     with st.spinner(f"{current_agent.replace('_', ' ').title()} is working..."):
                         # Run the next step in the workflow
-                        st.session_state.state = st.session_state.graph.invoke(st.session_state.state)
-                        st.experimental_rerun()
+                        st.session_state.state = run_graph(
+                            st.session_state.graph, st.session_state.state, convo_placeholder, st.session_state.thread_id
+                        )
+                        convo_placeholder.markdown(render_messages(st.session_state.state["messages"]))
             else:
                 st.success("Development process complete!")
                 
@@ -369,6 +626,8 @@ def main():
             if st.session_state.state["design_docs"]:
                 with st.expander("Design Specifications", expanded=True):
                     st.markdown(st.session_state.state["design_docs"].get("specifications", ""))
+                with st.expander("Architecture", expanded=True):
+                    st.markdown(st.session_state.state["design_docs"].get("architecture", ""))
             
             # Display test results
             if st.session_state.state["test_results"]:
@@ -388,24 +647,13 @@ def main():
                     with st.expander(f"Module: {module_name}", expanded=True):
                         st.code(module_data["code"], language=module_data["language"])
                         
-                        # Add a download button for each code module
-                        tmp_file = tempfile.NamedTemporaryFile(delete=False, suffix=f".{module_data['language']}")
-                        with open(tmp_file.name, 'w',encoding='utf-8') as f:
-                            f.write(module_data["code"])
-                        
-                        with open(tmp_file.name, 'rb') as f:
-                            st.download_button(
-                                label=f"Download {module_name}.{module_data['language']}",
-                                data=f,
-                                file_name=f"{module_name}.{module_data['language']}",
-                                mime="text/plain"
-                            )
-                        
-                        # Clean up temp file
-                        try:
-                            os.unlink(tmp_file.name)
-                        except:
-                            pass  # Silently ignore if deletion fails
+                        # Add a download button for each code module, served straight from memory
+                        st.download_button(
+                            label=f"Download {module_name}.{module_data['language']}",
+                            data=module_data["code"].encode("utf-8"),
+                            file_name=f"{module_name}.{module_data['language']}",
+                            mime="text/plain"
+                        )
         with tabs[3]:  # Final Product
             if st.session_state.state["current_stage"] == "complete":
                 st.subheader("Final Product Showcase")
@@ -415,18 +663,17 @@ def main():
                 
                 # Extract project name and description from PM's response
                 pm_response = st.session_state.state["messages"][0].content if st.session_state.state["messages"] else ""
-                project_name_match = re.search(r"# (.+?)(\n|$)", pm_response)
+                project_name_match = PROJECT_NAME_RE.search(pm_response)
                 project_name = project_name_match.group(1) if project_name_match else "Application"
                 
                 st.markdown(f"**Project Name**: {project_name}")
                 
                 # Display key features from PM's response
-                features_section = re.search(r"(?:Features|Main features|Key features):(.*?)(?:\n#|\n\n\d\.|\Z)", 
-                                            pm_response, re.DOTALL | re.IGNORECASE)
+                features_section = FEATURES_SECTION_RE.search(pm_response)
                 if features_section:
                     st.markdown("**Key Features**:")
                     features_text = features_section.group(1).strip()
-                    features = re.findall(r"[-\*•]?\s*(.*?)(?:\n[-\*•]|\n\n|\Z)", features_text, re.DOTALL)
+                    features = FEATURE_ITEM_RE.findall(features_text)
                     for feature in features:
                         st.markdown(f"- {feature.strip()}")
                 
@@ -1,11 +1,31 @@
 import streamlit as st
 import os
-import tempfile
+import asyncio
+import copy
 import time
-import pdfplumber
+import pypdfium2 as pdfium
 import openai
-from fpdf import FPDF
+from openai import AsyncOpenAI
+from fpdf import FPDF, XPos, YPos
+from fpdf.fonts import TTFFont
+from fontTools import ttLib
 import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pdf_workers import PDFIUM_LOCK, extract_pdfium_page_range
+import hashlib
+import uuid
+import json
+import shelve
+import numpy as np
+import threading
+import queue
+import re
+import random
+import atexit
+import importlib.util
+import httpx
+from pathlib import Path
 from typing import List, Dict, Any
 from dotenv import load_dotenv
 
@@ -23,15 +43,201 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Maximum number of OpenAI requests in flight at once, to stay under rate limits
+MAX_CONCURRENT_REQUESTS = 5
+
+# Sections produced by the requirements pipeline, used to track progress
+STAGE_SECTIONS = [
+    "User Stories",
+    "Project Management Plan",
+    "UI/UX Design Specifications",
+    "Development Plan",
+    "Technology Design",
+    "Test Scenarios",
+    "Test Cases"
+]
+
+# Agents run on DEFAULT_MODEL unless listed here (agent name -> model). Every stage currently
+# stays on the default; the sidebar can still switch all agents to another model at once
+DEFAULT_MODEL = "gpt-4o-mini"
+AGENT_MODELS = {}
+
+# Sidebar choices for overriding every agent's model at once
+PER_AGENT_MODELS = "Per-agent defaults"
+MODEL_OVERRIDE_OPTIONS = [PER_AGENT_MODELS, "gpt-4.1-nano", "gpt-4o-mini", "gpt-4.1-mini", "gpt-4o"]
+
+# Cached LLM responses live here and expire after a week
+LLM_CACHE_DIR = Path.home() / ".cache" / "kryon_llm"
+LLM_CACHE_TTL_SECONDS = 7 * 86400
+# Oldest cached responses are evicted past this many
+RESPONSE_CACHE_MAX_ENTRIES = 2000
+
+# Persistent exact-match cache for LLM responses, keyed on (model, prompt)
+class ResponseCache:
+    def __init__(self, path, ttl, max_entries):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = str(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # Streamlit sessions run on separate threads, and shelve is not thread-safe
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        
+        # Drop expired entries, and index the rest by store time (oldest first) for eviction
+        now = time.time()
+        stored = []
+        with self.lock, shelve.open(self.path) as cache:
+            for key in list(cache.keys()):
+                stored_at = cache[key]["stored_at"]
+                if now - stored_at > ttl:
+                    del cache[key]
+                else:
+                    stored.append((stored_at, key))
+        self.stored_at = {key: stored_at for stored_at, key in sorted(stored)}
+    
+    def key(self, model, messages):
+        payload = json.dumps({"model": model, "prompt": messages}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    def get(self, key):
+        with self.lock, shelve.open(self.path) as cache:
+            entry = cache.get(key)
+            # Expired entries are deleted as they're found, so the store doesn't keep them forever
+            if entry is not None and time.time() - entry["stored_at"] > self.ttl:
+                del cache[key]
+                self.stored_at.pop(key, None)
+                entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry["result"]
+    
+    def set(self, key, result):
+        now = time.time()
+        with self.lock, shelve.open(self.path) as cache:
+            cache[key] = {"stored_at": now, "result": result}
+            # Re-insert so a rewritten key moves to the newest end of the index
+            self.stored_at.pop(key, None)
+            self.stored_at[key] = now
+            
+            # Evict the oldest entries once the store is over its cap
+            while len(self.stored_at) > self.max_entries:
+                old_key = next(iter(self.stored_at))
+                del self.stored_at[old_key]
+                cache.pop(old_key, None)
+
+# Share one cache (and its hit/miss counters) across reruns and sessions
+@st.cache_resource
+def get_response_cache():
+    return ResponseCache(LLM_CACHE_DIR / "responses", LLM_CACHE_TTL_SECONDS, RESPONSE_CACHE_MAX_ENTRIES)
+
+# Embedding model and default cosine similarity for the semantic cache. The cache is opt-in: stage
+# prompts rarely come close enough to hit, and every exact-cache miss would pay a serial embeddings
+# round-trip, so at 1.0 the semantic layer is skipped entirely
+EMBEDDING_MODEL = "text-embedding-3-small"
+SEMANTIC_CACHE_THRESHOLD = 1.0
+# Oldest semantic cache entries are evicted past this many
+SEMANTIC_CACHE_MAX_ENTRIES = 5000
+
+# Embedding-similarity cache that catches near-duplicate prompts the exact-match cache misses.
+# Each entry is its own shelve record, so an insert writes one record rather than the whole store
+class SemanticCache:
+    def __init__(self, path, ttl, max_entries):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = str(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.hits = 0
+        
+        now = time.time()
+        records = []
+        with self.lock, shelve.open(self.path) as store:
+            for key in list(store.keys()):
+                # Drop expired entries, and the earlier layout that kept everything in two records
+                if key in ("vectors", "entries") or now - store[key]["stored_at"] > ttl:
+                    del store[key]
+                else:
+                    records.append((key, store[key]))
+        records.sort(key=lambda record: record[1]["stored_at"])
+        
+        # Entries are kept oldest first; rows of vectors are unit-normalized, so a dot product is the cosine similarity
+        self.keys = [key for key, _ in records]
+        self.entries = [entry for _, entry in records]
+        self.vectors = np.array([entry["vector"] for entry in self.entries], dtype=np.float32)
+    
+    def lookup(self, embedding, model, role, scope, threshold):
+        with self.lock:
+            vectors, entries = self.vectors, self.entries
+        if not entries:
+            return None
+        query = np.asarray(embedding, dtype=np.float32)
+        scores = vectors @ (query / np.linalg.norm(query))
+        # Only unexpired responses produced for the same role, model and shared context are eligible
+        now = time.time()
+        for index in np.argsort(scores)[::-1]:
+            if scores[index] < threshold:
+                return None
+            entry = entries[index]
+            if (entry["model"] == model and entry["role"] == role and entry["scope"] == scope
+                    and now - entry["stored_at"] <= self.ttl):
+                self.hits += 1
+                return entry["result"]
+        return None
+    
+    def add(self, embedding, model, role, scope, result):
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector = vector / np.linalg.norm(vector)
+        entry = {"vector": vector, "model": model, "role": role, "scope": scope, "result": result, "stored_at": time.time()}
+        key = uuid.uuid4().hex
+        with self.lock, shelve.open(self.path) as store:
+            store[key] = entry
+            keys = self.keys + [key]
+            entries = self.entries + [entry]
+            vectors = np.vstack([self.vectors, vector]) if self.entries else vector[np.newaxis, :]
+            
+            # Evict the oldest entries once the store is over its cap
+            overflow = len(keys) - self.max_entries
+            if overflow > 0:
+                for old_key in keys[:overflow]:
+                    del store[old_key]
+                keys, entries, vectors = keys[overflow:], entries[overflow:], vectors[overflow:]
+            
+            # Swap in new objects rather than mutating, so concurrent lookups see a consistent snapshot
+            self.keys, self.entries, self.vectors = keys, entries, vectors
+
+@st.cache_resource
+def get_semantic_cache():
+    return SemanticCache(LLM_CACHE_DIR / "semantic", LLM_CACHE_TTL_SECONDS, SEMANTIC_CACHE_MAX_ENTRIES)
+
+# Transient API failures worth retrying; anything else (bad request, auth) fails straight away
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError)
+RETRY_MIN_DELAY = 1
+RETRY_MAX_DELAY = 30
+
+# Model for an agent, honouring the sidebar override
+def agent_model(name):
+    override = st.session_state.get("model_override", PER_AGENT_MODELS)
+    if override != PER_AGENT_MODELS:
+        return override
+    return AGENT_MODELS.get(name, DEFAULT_MODEL)
+
 # Define the Agent class for multi-agent architecture
 class Agent:
-    def __init__(self, name, role, model="gpt-4o-mini"):
+    def __init__(self, name, role, client, model=None):
         self.name = name
         self.role = role
-        self.model = model
+        self.client = client
+        self.model = model or agent_model(name)
         self.history = []
+        # Resolved here on the script thread, since process() runs on the shared event loop's thread
+        self.response_cache = get_response_cache()
+        self.semantic_cache = get_semantic_cache()
     
-    def process(self, prompt, content=None, max_retries=3):
+    async def process(self, prompt, content=None, max_retries=6, on_token=None, context=None, prompt_cache_key=None,
+                      response_format=None, semantic_threshold=SEMANTIC_CACHE_THRESHOLD):
         if not openai.api_key:
             return "Error: OpenAI API key is not set in environment variables. Please check your .env file."
         
@@ -45,350 +251,520 @@ class Agent:
         Respond in a structured, clear format.
         """
         
+        # Shared context goes first in its own message, so every agent in a run sends the
+        # same leading tokens and OpenAI's prompt-prefix cache can reuse them
+        messages = [{"role": "user", "content": full_prompt}]
+        if context:
+            messages.insert(0, {"role": "system", "content": context})
+        
+        # Identical prompts to the same model are answered from the cache
+        cache = self.response_cache
+        cache_key = cache.key(self.model, messages + [{"response_format": response_format}] if response_format else messages)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            self.history.append({"prompt": prompt, "response": cached})
+            if on_token:
+                on_token(cached)
+            return cached
+        
+        # Near-duplicate prompts for the same role are answered from the semantic cache. Structured
+        # calls (feedback revisions) skip it: different feedback on the same long section embeds
+        # almost identically, and would get the previous revision back
+        embedding = None
+        if response_format is None and semantic_threshold < 1.0:
+            semantic_cache = self.semantic_cache
+            # Embed only the stage's own instruction and content; the shared context would swamp it
+            # and push long documents over the embedding input limit, so it scopes the match instead
+            scope = hashlib.sha256(context.encode("utf-8")).hexdigest() if context else None
+            try:
+                embedding_response = await self.client.embeddings.create(
+                    model=EMBEDDING_MODEL,
+                    input=full_prompt
+                )
+                embedding = embedding_response.data[0].embedding
+            except Exception:
+                # Prompts over the embedding model's input limit just skip the semantic layer
+                embedding = None
+            if embedding is not None:
+                similar = semantic_cache.lookup(embedding, self.model, self.role, scope, semantic_threshold)
+                if similar is not None:
+                    self.history.append({"prompt": prompt, "response": similar})
+                    if on_token:
+                        on_token(similar)
+                    return similar
+        
         for attempt in range(max_retries):
             try:
-                response=openai.chat.completions.create(
+                response = await self.client.chat.completions.create(
                     model=self.model,
-                    messages=[{"role": "user", "content": full_prompt}]
+                    messages=messages,
+                    stream=True,
+                    response_format=response_format or openai.NOT_GIVEN,
+                    # Routes requests that share a prefix to the same cache shard
+                    extra_body={"prompt_cache_key": prompt_cache_key} if prompt_cache_key else None
                 )
-                result = response.choices[0].message.content
+                # Stream tokens so callers can show the response while it is generated
+                parts = []
+                async for chunk in response:
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        parts.append(delta)
+                        if on_token:
+                            on_token("".join(parts))
+                result = "".join(parts)
+                cache.set(cache_key, result)
+                if embedding is not None:
+                    semantic_cache.add(embedding, self.model, self.role, scope, result)
                 self.history.append({"prompt": prompt, "response": result})
                 return result
-            except Exception as e:
+            except RETRYABLE_ERRORS as e:
                 if attempt == max_retries - 1:
                     return f"Error: {str(e)}"
-                time.sleep(2)  # Wait before retrying
+                # Exponential backoff with jitter, so parallel agents don't retry in lockstep
+                delay = min(RETRY_MAX_DELAY, RETRY_MIN_DELAY * 2 ** attempt)
+                await asyncio.sleep(random.uniform(RETRY_MIN_DELAY, delay))
+            except Exception as e:
+                return f"Error: {str(e)}"
+
+# Pooled keep-alive connections, multiplexed over HTTP/2 when the h2 package is installed
+HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+
+# One event loop for the whole process, running on a daemon thread. httpx connections belong to the
+# loop that opened them, so every session's coroutines run here and share the pooled client below
+@st.cache_resource
+def get_event_loop():
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="openai-event-loop", daemon=True).start()
+    return loop
+
+# One OpenAI client for the whole process, closed on the shared loop at exit
+@st.cache_resource
+def get_openai_client():
+    http_client = httpx.AsyncClient(
+        http2=importlib.util.find_spec("h2") is not None,
+        limits=HTTP_LIMITS,
+        timeout=60
+    )
+    # Agent.process owns retries with jittered backoff, so the SDK's own retries are turned off
+    client = AsyncOpenAI(api_key=openai.api_key, http_client=http_client, max_retries=0)
+    atexit.register(close_openai_client, get_event_loop(), client)
+    return client
+
+def close_openai_client(loop, client):
+    asyncio.run_coroutine_threadsafe(client.close(), loop).result(timeout=5)
+    loop.call_soon_threadsafe(loop.stop)
+
+# Run a coroutine on the shared event loop and wait for its result
+def run_on_event_loop(coro):
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop()).result()
+
+# Agents are built once per session and model choice. They keep a per-session history, so they
+# live in session_state rather than the cross-session st.cache_resource
+def get_agents():
+    client = get_openai_client()
+    model_override = st.session_state.get("model_override", PER_AGENT_MODELS)
+    if st.session_state.get("agents_model_override") != model_override or "agents" not in st.session_state:
+        st.session_state.agents = {
+            "user_story": Agent("User Story Generator", "User Story Specialist", client),
+            "tech_design": Agent("Technology Designer", "Technology Architect", client),
+            "test_scenario": Agent("Test Scenario Generator", "QA Specialist", client),
+            "test_case": Agent("Test Case Generator", "Test Engineer", client),
+            "project_manager": Agent("Project Manager", "Project Manager", client),
+            "designer": Agent("Designer", "UI/UX Designer", client),
+            "developer": Agent("Developer", "Software Developer", client),
+            "feedback": Agent("Feedback Processor", "Feedback Specialist", client)
+        }
+        st.session_state.agents_model_override = model_override
+    return st.session_state.agents
+
+# Run a single agent call outside the pipeline
+def run_agent(agent_key, prompt, content=None, response_format=None):
+    agent = get_agents()[agent_key]
+    return run_on_event_loop(agent.process(prompt, content, response_format=response_format))
+
+# Structured output for feedback, so one call returns both the revision and its change summary
+REVISION_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "revision",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "revised_content": {"type": "string"},
+                "changes_description": {"type": "string"}
+            },
+            "required": ["revised_content", "changes_description"],
+            "additionalProperties": False
+        }
+    }
+}
+
+# PDFs with at least this many pages are extracted across worker processes
+PARALLEL_PDF_MIN_PAGES = 16
+
+# Function to extract text from PDF (PDFium parses the uploaded bytes natively, no temp file).
+# Streamlit hashes the bytes, so re-processing an unchanged upload skips extraction entirely.
+# Errors propagate rather than returning "", so a failed extraction is never cached.
+@st.cache_data(show_spinner=False, max_entries=8)
+def extract_text_from_pdf(pdf_bytes):
+    # Sessions run on separate script threads, so hold the PDFium lock for the whole extraction.
+    # That includes starting the pool, so no other thread is inside PDFium when the workers fork.
+    with PDFIUM_LOCK:
+        pdf = pdfium.PdfDocument(pdf_bytes)
+        page_count = len(pdf)
+        pdf.close()
+        
+        # PDFium is not thread-safe, so large PDFs are split across forked processes instead of threads;
+        # spawned workers would re-import the app's entry point, so platforms without fork stay serial
+        if page_count < PARALLEL_PDF_MIN_PAGES or "fork" not in multiprocessing.get_all_start_methods():
+            return extract_pdfium_page_range(pdf_bytes, 0, page_count)
+        
+        workers = min(os.cpu_count() or 1, page_count)
+        bounds = [page_count * i // workers for i in range(workers + 1)]
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork")) as executor:
+            return "".join(executor.map(extract_pdfium_page_range, [pdf_bytes] * workers, bounds[:-1], bounds[1:]))
+
+# Numbered list items such as "1. " or "12. " in generated report content
+NUMBERED_ITEM_RE = re.compile(r"^\d+\.\s")
 
-# Function to extract text from PDF
-def extract_text_from_pdf(uploaded_file):
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-        tmp_file.write(uploaded_file.getvalue())
-        tmp_file_path = tmp_file.name
+# Unicode characters FPDF's Latin-1 fonts can't render, mapped to ASCII stand-ins.
+# str.maketrans accepts multi-character replacements, so one translate() pass covers them all.
+LATIN1_REPLACEMENTS = str.maketrans({
+    '\u2019': "'",    # Replace right single quote
+    '\u2018': "'",    # Replace left single quote
+    '\u201c': '"',    # Replace left double quote
+    '\u201d': '"',    # Replace right double quote
+    '\u2013': '-',    # Replace en dash
+    '\u2014': '--',   # Replace em dash
+    '\u2026': '...',  # Replace ellipsis
+    '\u00a0': ' ',    # Replace non-breaking space
+    '\u2022': '*',    # Replace bullet point
+    '\u2192': '->',   # Replace right arrow
+    '\u2190': '<-',   # Replace left arrow
+    '\u2191': '^',    # Replace up arrow
+    '\u2193': 'v',    # Replace down arrow
+    '\u25b2': '^',    # Replace up triangle
+    '\u25bc': 'v',    # Replace down triangle
+    '\u2212': '-',    # Replace minus sign
+    '\u00d7': 'x',    # Replace multiplication sign
+    '\u00f7': '/',    # Replace division sign
+    '\u2032': "'",    # Replace prime
+    '\u2033': '"',    # Replace double prime
+    '\u2265': '>=',   # Replace greater than or equal to
+    '\u2264': '<=',   # Replace less than or equal to
+    '\u2248': '~=',   # Replace approximately equal
+    '\u00b1': '+/-',  # Replace plus-minus
+})
+
+# Unicode TrueType fonts to look for, as (regular, bold, italic) files; the first set whose regular face exists is used
+UNICODE_FONT_CANDIDATES = [
+    ("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+     "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
+     "/usr/share/fonts/truetype/dejavu/DejaVuSans-Oblique.ttf"),
+    ("C:/Windows/Fonts/arial.ttf",
+     "C:/Windows/Fonts/arialbd.ttf",
+     "C:/Windows/Fonts/ariali.ttf"),
+    ("/System/Library/Fonts/Supplemental/Arial.ttf",
+     "/System/Library/Fonts/Supplemental/Arial Bold.ttf",
+     "/System/Library/Fonts/Supplemental/Arial Italic.ttf"),
+]
+
+# Find a Unicode font set on this machine, or None to fall back to the Latin-1 core fonts
+def find_unicode_font():
+    for regular, bold, italic in UNICODE_FONT_CANDIDATES:
+        if os.path.exists(regular):
+            # Distros often ship only some faces (fonts-dejavu-core has no oblique), so missing styles reuse the regular file
+            return tuple(path if os.path.exists(path) else regular for path in (regular, bold, italic))
+    return None
+
+# Custom PDF class to add headers and footers, in the Unicode font set if one was found
+class ReportPDF(FPDF):
+    def __init__(self, font_paths):
+        super().__init__()
+        self.font_paths = font_paths
+        self.report_font = "Unicode" if font_paths else "helvetica"
+        if font_paths:
+            regular, bold, italic = font_paths
+            self.add_font(self.report_font, "", regular)
+            self.add_font(self.report_font, "B", bold)
+            self.add_font(self.report_font, "I", italic)
     
-    text = ""
-    try:
-        with pdfplumber.open(tmp_file_path) as pdf:
-            for page in pdf.pages:
-                extracted = page.extract_text()
-                if extracted:
-                    text += extracted + "\n\n"
-    except Exception as e:
-        st.error(f"Error extracting text from PDF: {str(e)}")
-        st.error(traceback.format_exc())
-    finally:
-        os.unlink(tmp_file_path)
+    def header(self):
+        # Logo - using a placeholder since we don't have an actual logo
+        # self.image('logo.png', 10, 8, 33)
+        # Set font for header
+        self.set_font(self.report_font, 'B', 12)
+        # Title
+        self.cell(0, 10, 'Requirements Processing Report', align='C', new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        # Line break
+        self.ln(5)
     
-    return text
+    def footer(self):
+        # Position at 1.5 cm from bottom
+        self.set_y(-15)
+        # Set font for footer
+        self.set_font(self.report_font, 'I', 8)
+        # Page number
+        self.cell(0, 10, f'Page {self.page_no()}', align='C')
 
-# Function to generate PDF from content
+# Blank report with its fonts already parsed; TTF parsing dominates setup, so each report deep-copies this instead
+@st.cache_resource
+def get_pdf_template():
+    return ReportPDF(find_unicode_font())
+
+# Function to generate PDF from content (fpdf2, which embeds TTF fonts with full Unicode support)
 def generate_pdf(content_dict):
-    # Create a custom PDF class to add headers and footers
-    class PDF(FPDF):
-        def header(self):
-            # Logo - using a placeholder since we don't have an actual logo
-            # self.image('logo.png', 10, 8, 33)
-            # Set font for header
-            self.set_font('Arial', 'B', 12)
-            # Title
-            self.cell(0, 10, 'Requirements Processing Report', 0, 1, 'C')
-            # Line break
-            self.ln(5)
-        
-        def footer(self):
-            # Position at 1.5 cm from bottom
-            self.set_y(-15)
-            # Set font for footer
-            self.set_font('Arial', 'I', 8)
-            # Page number
-            self.cell(0, 10, f'Page {self.page_no()}', 0, 0, 'C')
-    
     # Create PDF instance
-    pdf = PDF()
+    pdf = copy.deepcopy(get_pdf_template())
+    # fpdf2 shares each font's fontTools object between copies and output() subsets it in place,
+    # so the copy reopens its own (lazily, which is cheap; the parsed metrics are what's reused)
+    for pdf_font in pdf.fonts.values():
+        if isinstance(pdf_font, TTFFont):
+            pdf_font.ttfont = ttLib.TTFont(pdf_font.ttffile, recalcTimestamp=False, lazy=True)
+    font_paths = pdf.font_paths
+    font = pdf.report_font
     pdf.set_auto_page_break(auto=True, margin=15)
     pdf.add_page()
     
     # Set default font
-    pdf.set_font("Arial", size=11)
+    pdf.set_font(font, size=11)
     
     # Add title and document info
-    pdf.set_font("Arial", 'B', 16)
-    pdf.cell(0, 10, "Requirements Processing Report", ln=True, align='C')
-    pdf.set_font("Arial", 'I', 10)
-    pdf.cell(0, 10, f"Generated on {time.strftime('%Y-%m-%d %H:%M:%S')}", ln=True, align='C')
+    pdf.set_font(font, 'B', 16)
+    pdf.cell(0, 10, "Requirements Processing Report", align='C', new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.set_font(font, 'I', 10)
+    pdf.cell(0, 10, f"Generated on {time.strftime('%Y-%m-%d %H:%M:%S')}", align='C', new_x=XPos.LMARGIN, new_y=YPos.NEXT)
     pdf.ln(10)
     
-    # Add table of contents header
-    pdf.set_font("Arial", 'B', 14)
-    pdf.cell(0, 10, "Table of Contents", ln=True)
-    pdf.line(10, pdf.get_y(), 200, pdf.get_y())
-    pdf.ln(5)
-    
-    # Add table of contents
-    pdf.set_font("Arial", size=11)
-    y_position = pdf.get_y()
-    page_start = pdf.page_no()
+    # Render the table of contents once the document is complete and page numbers are known
+    def render_toc(pdf, outline):
+        # Add table of contents header
+        pdf.set_font(font, 'B', 14)
+        pdf.cell(0, 10, "Table of Contents", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        pdf.line(10, pdf.get_y(), 200, pdf.get_y())
+        pdf.ln(5)
+        
+        # Add table of contents
+        pdf.set_font(font, size=11)
+        for entry in outline:
+            pdf.cell(160, 10, entry.name)
+            pdf.cell(0, 10, f"Page {entry.page_number}", align='R', new_x=XPos.LMARGIN, new_y=YPos.NEXT)
     
-    # Placeholder for TOC items - we'll fill these in later
-    toc_placeholders = {}
-    for section in content_dict.keys():
-        toc_placeholders[section] = {'y': y_position, 'page': page_start}
-        pdf.cell(0, 10, f"{section}...", ln=True)
-        y_position += 10
+    # Reserve the rest of this page for the TOC; this also starts a new page for the first section
+    pdf.insert_toc_placeholder(render_toc)
     
     # Add each section with improved formatting
-    section_page_numbers = {}
-    for section, content in content_dict.items():
+    for index, (section, content) in enumerate(content_dict.items()):
         # Add a page break for each new section
-        pdf.add_page()
+        if index > 0:
+            pdf.add_page()
         
-        # Store the page number for this section for the TOC
-        section_page_numbers[section] = pdf.page_no()
+        # Register the section so fpdf2 tracks its page number for the TOC
+        pdf.start_section(section)
         
         # Section header with background
         pdf.set_fill_color(230, 230, 230)  # Light gray background
-        pdf.set_font("Arial", 'B', 14)
-        pdf.cell(0, 10, section, ln=True, fill=True)
+        pdf.set_font(font, 'B', 14)
+        pdf.cell(0, 10, section, fill=True, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
         pdf.ln(5)
         
         # Section content
-        pdf.set_font("Arial", size=11)
+        pdf.set_font(font, size=11)
         
         # Make sure content is str
         if not isinstance(content, str):
             content = str(content)
         
-        # Enhanced character replacement to handle more Unicode characters
-        content = (content
-            # Basic replacements from original code
-            .replace('\u2019', "'")  # Replace right single quote
-            .replace('\u2018', "'")  # Replace left single quote
-            .replace('\u201c', '"')  # Replace left double quote
-            .replace('\u201d', '"')  # Replace right double quote
-            .replace('\u2013', '-')  # Replace en dash
-            .replace('\u2014', '--') # Replace em dash
-            .replace('\u2026', '...') # Replace ellipsis
-            .replace('\u00a0', ' ')  # Replace non-breaking space
-            .replace('\u2022', '*')  # Replace bullet point
-            .replace('\u2192', '->') # Replace right arrow
-            .replace('\u2190', '<-')  # Replace left arrow
-            .replace('\u2191', '^')   # Replace up arrow
-            .replace('\u2193', 'v')   # Replace down arrow
-            .replace('\u25b2', '^')   # Replace up triangle
-            .replace('\u25bc', 'v')   # Replace down triangle
-            .replace('\u2212', '-')   # Replace minus sign
-            .replace('\u00d7', 'x')   # Replace multiplication sign
-            .replace('\u00f7', '/')   # Replace division sign
-            .replace('\u2032', "'")   # Replace prime
-            .replace('\u2033', '"')   # Replace double prime
-            .replace('\u2265', '>=')  # Replace greater than or equal to
-            .replace('\u2264', '<=')  # Replace less than or equal to
-            .replace('\u2248', '~=')  # Replace approximately equal
-            .replace('\u00b1', '+/-') # Replace plus-minus
-        )
-        
-        # Catch-all for any other non-Latin-1 characters
-        content = content.encode('latin-1', 'replace').decode('latin-1')
+        # The Latin-1 core fonts can't render other characters, so transcode only in that fallback
+        if not font_paths:
+            # Enhanced character replacement to handle more Unicode characters, in a single pass
+            content = content.translate(LATIN1_REPLACEMENTS)
+            
+            # Catch-all for any other non-Latin-1 characters
+            content = content.encode('latin-1', 'replace').decode('latin-1')
         
-        # Identify and format headings and bullet points
+        # Identify and format headings and bullet points; fpdf2 leaves the cursor at the right
+        # margin after multi_cell by default, so each line returns to the left margin explicitly
         paragraphs = content.split('\n')
         for paragraph in paragraphs:
-            if not paragraph.strip():
+            stripped = paragraph.strip()
+            if not stripped:
                 pdf.ln(5)
                 continue
                 
             # Check if this is a heading (assuming headings end with colon or are all caps)
-            if paragraph.strip().endswith(':') or paragraph.strip().isupper():
-                pdf.set_font("Arial", 'B', 12)
-                pdf.multi_cell(0, 10, paragraph.strip())
-                pdf.set_font("Arial", size=11)
+            if stripped.endswith(':') or stripped.isupper():
+                pdf.set_font(font, 'B', 12)
+                pdf.multi_cell(0, 10, stripped, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+                pdf.set_font(font, size=11)
                 continue
                 
             # Check if this is a bullet point
-            if paragraph.strip().startswith('- ') or paragraph.strip().startswith('* '):
+            if stripped.startswith(('- ', '* ')):
                 pdf.set_x(15)  # Indent bullet points
-                pdf.multi_cell(0, 7, paragraph)
+                pdf.multi_cell(0, 7, paragraph, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
                 continue
                 
             # Check if this is a numbered item
-            if (paragraph.strip()[0].isdigit() and 
-                paragraph.strip()[1:].startswith('. ')):
+            if NUMBERED_ITEM_RE.match(stripped):
                 pdf.set_x(15)  # Indent numbered items
-                pdf.multi_cell(0, 7, paragraph)
+                pdf.multi_cell(0, 7, paragraph, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
                 continue
                 
             # Regular paragraph
-            pdf.multi_cell(0, 7, paragraph)
+            pdf.multi_cell(0, 7, paragraph, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
         
         pdf.ln(10)
     
-    # Now go back and fill in the table of contents with the correct page numbers
-    # Save current position
-    current_page = pdf.page_no()
-    current_position = pdf.get_y()
-    
-    # Go back to the TOC page
-    pdf_toc_page = PDF()  # Create a new instance for TOC updates
-    pdf_toc_page.set_auto_page_break(auto=True, margin=15)
+    # fpdf2 returns the document as a bytearray when no file name is given, so it never touches disk
+    return bytes(pdf.output())
+
+# Function to process requirements, reporting each stage's start, tokens and result through emit
+async def run_pipeline(pdf_text, emit, agents, semantic_threshold):
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
     
-    # Copy the current PDF up to the TOC page
-    for i in range(1, page_start + 1):
-        pdf_toc_page.add_page()
+    # Every agent gets the requirements as an identical leading message, tagged with a per-document key
+    requirements_context = "Requirements document:\n" + pdf_text
+    run_cache_key = hashlib.blake2b(pdf_text.encode("utf-8"), digest_size=16).hexdigest()
     
-    # Set position for TOC updates
-    pdf_toc_page.set_font("Arial", 'B', 14)
-    pdf_toc_page.cell(0, 10, "Table of Contents", ln=True)
-    pdf_toc_page.line(10, pdf_toc_page.get_y(), 200, pdf_toc_page.get_y())
-    pdf_toc_page.ln(5)
+    # Agents are reused across runs in this session
+    user_story_agent = agents["user_story"]
+    tech_design_agent = agents["tech_design"]
+    test_scenario_agent = agents["test_scenario"]
+    test_case_agent = agents["test_case"]
+    project_manager_agent = agents["project_manager"]
+    designer_agent = agents["designer"]
+    developer_agent = agents["developer"]
     
-    # Update TOC with actual page numbers
-    pdf_toc_page.set_font("Arial", size=11)
-    for section, placeholder in toc_placeholders.items():
-        pdf_toc_page.set_y(placeholder['y'])
-        pdf_toc_page.set_x(10)
-        pdf_toc_page.cell(160, 10, section)
-        pdf_toc_page.cell(0, 10, f"Page {section_page_numbers[section]}", ln=True, align='R')
+    # Run one stage under the concurrency limit, streaming its output as it is generated
+    async def run_stage(section, status, agent, prompt, content):
+        async with semaphore:
+            emit(("started", section, status))
+            result = await agent.process(
+                prompt, content,
+                on_token=lambda text: emit(("token", section, text)),
+                context=requirements_context,
+                prompt_cache_key=run_cache_key,
+                semantic_threshold=semantic_threshold
+            )
+        emit(("finished", section, result))
+        return result
     
-    # Merge the TOC page with the rest of the content
-    # We'll handle this by creating the final PDF in memory
+    # Generate user stories
+    user_stories = await run_stage(
+        "User Stories", "Generating User Stories...", user_story_agent,
+        "Create user stories based on the requirements document. Format them as 'As a [user], I want [action] so that [benefit]'. Provide at least 5-7 user stories that cover the main functionality.",
+        None
+    )
     
-    # Create temporary file
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-        tmp_path = tmp_file.name
+    # Generate project management plan
+    project_plan_prompt = f"""
+    Create a detailed project management plan based on these requirements. 
     
-    pdf.output(tmp_path)
-    with open(tmp_path, "rb") as f:
-        pdf_data = f.read()
+    Include the following sections:
+    1. Project Timeline - with specific dates
+    2. Milestones
+    3. Resource Allocation - always specify exact resource counts (number of people) instead of percentages
+    4. Risk Assessment
+    5. Coordination Strategy
     
-    os.unlink(tmp_path)
-    return pdf_data
-
-# Function to process requirements
-def process_requirements(pdf_text, resource_constraints=None):
-    results = {}
+    Format with clear sections.
+    """
     
-    try:
-        # Check if API key is set
-        if not openai.api_key:
-            results["Error"] = "OpenAI API key is not set in environment variables. Please check your .env file."
-            return results
-            
-        # Initialize agents
-        user_story_agent = Agent("User Story Generator", "User Story Specialist")
-        tech_design_agent = Agent("Technology Designer", "Technology Architect")
-        test_scenario_agent = Agent("Test Scenario Generator", "QA Specialist")
-        test_case_agent = Agent("Test Case Generator", "Test Engineer")
-        
-        # Initialize new agents
-        project_manager_agent = Agent("Project Manager", "Project Manager")
-        designer_agent = Agent("Designer", "UI/UX Designer")
-        developer_agent = Agent("Developer", "Software Developer")
-        
-        # Set initial progress percentage
-        st.session_state.progress_percentage = 10
-        st.session_state.progress_bar.progress(st.session_state.progress_percentage / 100)
-        st.session_state.progress_text.text(f"Progress: {st.session_state.progress_percentage}%")
-        
-        # Generate user stories
-        st.session_state.status = "Generating User Stories..."
-        user_stories = user_story_agent.process(
-            "Create user stories based on the following requirements. Format them as 'As a [user], I want [action] so that [benefit]'. Provide at least 5-7 user stories that cover the main functionality.",
-            pdf_text
-        )
-        results["User Stories"] = user_stories
-        st.session_state.progress_percentage = 20
-        st.session_state.progress_bar.progress(st.session_state.progress_percentage / 100)
-        st.session_state.progress_text.text(f"Progress: {st.session_state.progress_percentage}%")
-        
-        # Generate project management plan
-        st.session_state.status = "Creating Project Management Plan..."
-        
-        project_plan_prompt = f"""
-        Create a detailed project management plan based on these requirements. 
-        
-        Include the following sections:
-        1. Project Timeline - with specific dates
-        2. Milestones
-        3. Resource Allocation - always specify exact resource counts (number of people) instead of percentages
-        4. Risk Assessment
-        5. Coordination Strategy
-        
-        Format with clear sections.
-        """
-        
-        project_plan = project_manager_agent.process(
+    async def project_plan_branch():
+        await run_stage(
+            "Project Management Plan", "Creating Project Management Plan...", project_manager_agent,
             project_plan_prompt,
-            pdf_text + "\n\nUser Stories:\n" + user_stories
+            "User Stories:\n" + user_stories
         )
-        results["Project Management Plan"] = project_plan
-        st.session_state.progress_percentage = 40
-        st.session_state.progress_bar.progress(st.session_state.progress_percentage / 100)
-        st.session_state.progress_text.text(f"Progress: {st.session_state.progress_percentage}%")
-        
+    
+    # Design, development and testing depend on each other, but not on the project plan
+    async def design_branch():
         # Generate UI/UX design documents
-        st.session_state.status = "Creating UI/UX Designs..."
-        ui_design = designer_agent.process(
+        ui_design = await run_stage(
+            "UI/UX Design Specifications", "Creating UI/UX Designs...", designer_agent,
             "Create detailed UI/UX design specifications based on these requirements. Include wireframe descriptions, user flow diagrams, style guide recommendations, and accessibility considerations. Format with clear sections for each design component.",
-            pdf_text + "\n\nUser Stories:\n" + user_stories
+            "User Stories:\n" + user_stories
         )
-        results["UI/UX Design Specifications"] = ui_design
-        st.session_state.progress_percentage = 60
-        st.session_state.progress_bar.progress(st.session_state.progress_percentage / 100)
-        st.session_state.progress_text.text(f"Progress: {st.session_state.progress_percentage}%")
         
         # Generate development plan
-        st.session_state.status = "Creating Development Plan..."
-        
         dev_plan_prompt = "Create a detailed development plan based on these requirements. Include component architecture, data models, API specifications, implementation strategy, and technical considerations. Format with clear sections for frontend, backend, and database components."
         
-        dev_plan = developer_agent.process(
+        dev_plan = await run_stage(
+            "Development Plan", "Creating Development Plan...", developer_agent,
             dev_plan_prompt,
-            pdf_text + "\n\nUser Stories:\n" + user_stories + "\n\nUI/UX Design:\n" + ui_design
+            "User Stories:\n" + user_stories + "\n\nUI/UX Design:\n" + ui_design
         )
-        results["Development Plan"] = dev_plan
-        st.session_state.progress_percentage = 70
-        st.session_state.progress_bar.progress(st.session_state.progress_percentage / 100)
-        st.session_state.progress_text.text(f"Progress: {st.session_state.progress_percentage}%")
         
         # Generate technology design
-        st.session_state.status = "Creating Technology Design..."
-        tech_design = tech_design_agent.process(
-            "Create a detailed technology design based on these requirements. Include frontend, backend, database, and integration components. For each technology choice, provide justification on why it's the best fit. Format as bullet points with clear sections.",
-            pdf_text + "\n\nDevelopment Plan:\n" + dev_plan
-        )
-        results["Technology Design"] = tech_design  # Changed from "Technology Design with Justification"
-        st.session_state.progress_percentage = 80
-        st.session_state.progress_bar.progress(st.session_state.progress_percentage / 100)
-        st.session_state.progress_text.text(f"Progress: {st.session_state.progress_percentage}%")
+        async def tech_design_branch():
+            await run_stage(
+                "Technology Design", "Creating Technology Design...", tech_design_agent,
+                "Create a detailed technology design based on these requirements. Include frontend, backend, database, and integration components. For each technology choice, provide justification on why it's the best fit. Format as bullet points with clear sections.",
+                "Development Plan:\n" + dev_plan
+            )
         
-        # Generate test scenarios
-        st.session_state.status = "Generating Test Scenarios..."
-        test_scenarios = test_scenario_agent.process(
-            "Create test scenarios based on these requirements. Focus on key user journeys and critical functionality. Format as numbered scenarios with brief descriptions.",
-            pdf_text + "\n\nUser Stories:\n" + user_stories + "\n\nDevelopment Plan:\n" + dev_plan
-        )
-        results["Test Scenarios"] = test_scenarios
-        st.session_state.progress_percentage = 90
-        st.session_state.progress_bar.progress(st.session_state.progress_percentage / 100)
-        st.session_state.progress_text.text(f"Progress: {st.session_state.progress_percentage}%")
+        # Generate test scenarios, then test cases
+        async def test_branch():
+            test_scenarios = await run_stage(
+                "Test Scenarios", "Generating Test Scenarios...", test_scenario_agent,
+                "Create test scenarios based on these requirements. Focus on key user journeys and critical functionality. Format as numbered scenarios with brief descriptions.",
+                "User Stories:\n" + user_stories + "\n\nDevelopment Plan:\n" + dev_plan
+            )
+            await run_stage(
+                "Test Cases", "Creating Test Cases...", test_case_agent,
+                "Create detailed test cases based on these requirements. Include test case ID, description, preconditions, steps, expected results, and pass/fail criteria. Format in a structured way for clarity.",
+                "Test Scenarios:\n" + test_scenarios + "\n\nUser Stories:\n" + user_stories
+            )
         
-        # Generate test cases
-        st.session_state.status = "Creating Test Cases..."
-        test_cases = test_case_agent.process(
-            "Create detailed test cases based on these requirements. Include test case ID, description, preconditions, steps, expected results, and pass/fail criteria. Format in a structured way for clarity.",
-            pdf_text + "\n\nTest Scenarios:\n" + test_scenarios + "\n\nUser Stories:\n" + user_stories
-        )
-        results["Test Cases"] = test_cases
-        st.session_state.progress_percentage = 100
-        st.session_state.progress_bar.progress(st.session_state.progress_percentage / 100)
-        st.session_state.progress_text.text(f"Progress: {st.session_state.progress_percentage}%")
+        await asyncio.gather(tech_design_branch(), test_branch())
+    
+    await asyncio.gather(project_plan_branch(), design_branch())
+
+# Generator over finished stages; the caller owns all progress and results updates
+def process_requirements(pdf_text, resource_constraints=None):
+    # Check if API key is set
+    if not openai.api_key:
+        yield "Error", 0, "OpenAI API key is not set in environment variables. Please check your .env file."
+        return
+    
+    # Independent stages run concurrently on the shared loop, so wall time follows the longest dependency chain
+    events = queue.SimpleQueue()
+    threshold = st.session_state.get("semantic_threshold", SEMANTIC_CACHE_THRESHOLD)
+    pipeline = asyncio.run_coroutine_threadsafe(
+        run_pipeline(pdf_text, events.put, get_agents(), threshold),
+        get_event_loop()
+    )
+    # Wake up when the pipeline ends too, so a failed stage doesn't leave us waiting on the queue
+    pipeline.add_done_callback(lambda _: events.put(None))
+    
+    try:
+        # Streamlit calls only work on the script thread, so the pipeline reports events and they are drawn here
+        placeholders = {}
+        done = 0
+        while (event := events.get()) is not None:
+            kind, section, payload = event
+            if kind == "started":
+                st.session_state.status = payload
+                placeholders[section] = st.expander(section, expanded=True).empty()
+            elif kind == "token":
+                placeholders[section].markdown(payload)
+            else:
+                done += 1
+                yield section, 10 + 90 * done // len(STAGE_SECTIONS), payload
+        pipeline.result()
     
     except Exception as e:
         error_msg = f"Error during processing: {str(e)}\n\n{traceback.format_exc()}"
         st.error(error_msg)
-        results["Error"] = error_msg
+        yield "Error", st.session_state.progress_percentage, error_msg
+    
+    finally:
+        # Stop any stages still in flight if the run failed or the caller stopped early
+        pipeline.cancel()
     
     st.session_state.status = "Processing Complete"
-    return results
 
 # Initialize session state variables
 if 'pdf_text' not in st.session_state:
@@ -439,7 +815,12 @@ with st.sidebar:
             st.error("OpenAI API key is not found in environment variables. Please check your .env file.")
         else:
             with st.spinner("Extracting text from PDF..."):
-                st.session_state.pdf_text = extract_text_from_pdf(uploaded_file)
+                try:
+                    st.session_state.pdf_text = extract_text_from_pdf(uploaded_file.getvalue())
+                except Exception as e:
+                    st.error(f"Error extracting text from PDF: {str(e)}")
+                    st.error(traceback.format_exc())
+                    st.session_state.pdf_text = ""
                 if st.session_state.pdf_text:
                     st.session_state.processing = True
                     st.session_state.results = {}
@@ -455,6 +836,22 @@ with st.sidebar:
     
     # Removed the "Download Results as PDF" button from here
     
+    response_cache = get_response_cache()
+    st.caption(f"LLM cache: {response_cache.hits} hits / {response_cache.misses} misses")
+    st.caption(f"Semantic cache: {get_semantic_cache().hits} hits")
+    st.slider(
+        "Semantic cache similarity threshold",
+        min_value=0.80, max_value=1.0, value=SEMANTIC_CACHE_THRESHOLD, step=0.01,
+        key="semantic_threshold",
+        help="Prompts at least this similar to a cached one reuse its response. At 1.0 (the default) the semantic cache is off and no embeddings are requested."
+    )
+    st.selectbox(
+        "Model",
+        MODEL_OVERRIDE_OPTIONS,
+        key="model_override",
+        help="Run every agent on one model instead of the per-agent defaults."
+    )
+    
     if st.session_state.processing or st.session_state.results:
         if st.button("End Session"):
             st.session_state.pdf_text = None
@@ -465,16 +862,34 @@ with st.sidebar:
             st.session_state.resource_constraints = None
             st.session_state.status = "Ready"
             st.session_state.progress_percentage = 0
+            # Start the next session with fresh agents and empty agent histories
+            st.session_state.pop("agents", None)
             status_placeholder.info(f"Current status: {st.session_state.status}")
             st.rerun()
 
 # Process the document if needed
 if st.session_state.processing:
     with st.spinner("Processing document... This may take a few minutes."):
-        st.session_state.results = process_requirements(
+        # Set initial progress percentage
+        st.session_state.progress_percentage = 10
+        st.session_state.progress_bar.progress(st.session_state.progress_percentage / 100)
+        st.session_state.progress_text.text(f"Progress: {st.session_state.progress_percentage}%")
+        
+        results = {}
+        for section, pct, content in process_requirements(
             st.session_state.pdf_text,
             st.session_state.resource_constraints
-        )
+        ):
+            results[section] = content
+            st.session_state.progress_percentage = pct
+            st.session_state.progress_bar.progress(pct / 100)
+            st.session_state.progress_text.text(f"Progress: {pct}%")
+        
+        # Stages finish out of order; keep the report in pipeline order
+        if "Error" in results:
+            st.session_state.results = {"Error": results["Error"]}
+        else:
+            st.session_state.results = {section: results[section] for section in STAGE_SECTIONS}
         st.session_state.processing = False
         st.rerun()
 
@@ -551,25 +966,26 @@ if st.session_state.results:
                                 st.session_state.progress_percentage = 30
                                 st.session_state.progress_bar.progress(st.session_state.progress_percentage / 100)
                                 st.session_state.progress_text.text(f"Progress: {st.session_state.progress_percentage}%")
-                                time.sleep(0.5)  # Short delay to show progress
-                                
-                                feedback_agent = Agent("Feedback Processor", "Feedback Specialist")
-                                improved_content = feedback_agent.process(
-                                    f"Revise the following {section.lower()} based on this feedback: {feedback}",
-                                    st.session_state.results[section]
-                                )
-                                
-                                # Update progress to 70%
-                                st.session_state.progress_percentage = 70
-                                st.session_state.progress_bar.progress(st.session_state.progress_percentage / 100)
-                                st.session_state.progress_text.text(f"Progress: {st.session_state.progress_percentage}%")
-                                time.sleep(0.5)  # Short delay to show progress
                                 
-                                # Create descriptive response about changes made
-                                changes_description = feedback_agent.process(
-                                    f"Describe in detail what changes you made to the {section.lower()} based on this feedback: {feedback}. Be specific about what was modified, added, or removed.",
-                                    f"Original content: {st.session_state.results[section]}\n\nUpdated content: {improved_content}"
+                                # Revise the content and describe the changes made in a single call
+                                revision_json = run_agent(
+                                    "feedback",
+                                    f"Revise the following {section.lower()} based on this feedback: {feedback}. "
+                                    f"Return the complete revised {section.lower()} as revised_content, and describe in detail what changes you made "
+                                    f"as changes_description. Be specific about what was modified, added, or removed.",
+                                    st.session_state.results[section],
+                                    response_format=REVISION_RESPONSE_FORMAT
                                 )
+                                try:
+                                    revision = json.loads(revision_json)
+                                except json.JSONDecodeError:
+                                    # Errors come back as plain text; keep the content and surface the message
+                                    revision = {
+                                        "revised_content": st.session_state.results[section],
+                                        "changes_description": revision_json
+                                    }
+                                improved_content = revision["revised_content"]
+                                changes_description = revision["changes_description"]
                                 
                                 # Update progress to 100%
                                 st.session_state.progress_percentage = 100
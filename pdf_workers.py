@@ -0,0 +1,32 @@
+# Page-range text extraction run in worker processes for large PDFs. The workers live in this
+# importable module because Streamlit reinstalls the app script as __main__ on every rerun of any
+# session, so functions defined there can't be pickled reliably while other sessions are active.
+# Each app uses a different PDF library, so they are imported in the function that needs them.
+from io import BytesIO
+import threading
+
+# PDFium is not thread-safe, so all in-process use of it is serialized on this lock. It lives here
+# rather than in the app script because Streamlit re-executes the script (and would recreate the lock)
+# on every rerun, while this module is imported once per process
+PDFIUM_LOCK = threading.Lock()
+
+# Extract text from a range of pages with pypdf (e2e_development_agent.py)
+def extract_page_range(raw, start, stop):
+    from pypdf import PdfReader
+    pdf_reader = PdfReader(BytesIO(raw))
+    return "".join(pdf_reader.pages[i].extract_text() for i in range(start, stop))
+
+# Extract text from a range of pages with PDFium (e2e_development_agent_Hackathon.py)
+def extract_pdfium_page_range(pdf_bytes, start, stop):
+    import pypdfium2 as pdfium
+    pdf = pdfium.PdfDocument(pdf_bytes)
+    try:
+        texts = []
+        for index in range(start, stop):
+            # PDFium separates lines with CRLF
+            extracted = pdf[index].get_textpage().get_text_range().replace("\r\n", "\n")
+            if extracted:
+                texts.append(extracted + "\n\n")
+        return "".join(texts)
+    finally:
+        pdf.close()